@@ -0,0 +1,10 @@
+import asyncio
+from server import client, rebuild_sales_rollups
+
+async def main():
+    buckets = await rebuild_sales_rollups()
+    print(f"Rebuilt {buckets} sales rollup buckets")
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,14 +1,27 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 from motor.motor_asyncio import AsyncIOMotorClient
+import pymongo
+from pymongo import ReplaceOne, UpdateOne, ReturnDocument, monitoring
+from pymongo.errors import BulkWriteError, ExecutionTimeout, NetworkTimeout, ServerSelectionTimeoutError, WTimeoutError
 import os
+import io
 import logging
 import asyncio
+import cProfile
+import contextvars
+import marshal
+import pstats
+import random
+import time
+from collections import OrderedDict, deque
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional
+from pydantic import BaseModel, Field, EmailStr, TypeAdapter, create_model
+from typing import Dict, List, Optional, Tuple, Union
+from functools import lru_cache
 import uuid
 from datetime import datetime, timezone, timedelta
 import jwt
@@ -17,9 +30,50 @@ import bcrypt
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Mongo command timeline of the request being profiled, if any
+profile_timeline = contextvars.ContextVar('profile_timeline', default=None)
+
+# Records Mongo commands issued while a profiled request is running
+class MongoCommandTimeline(monitoring.CommandListener):
+    def started(self, event):
+        timeline = profile_timeline.get()
+        if timeline is None:
+            return
+        target = event.command.get(event.command_name)
+        command = {
+            "command": event.command_name,
+            "collection": target if isinstance(target, str) else None,
+            "offset_ms": round((time.perf_counter() - timeline['start']) * 1000, 3),
+            "duration_ms": None,
+            "ok": None,
+        }
+        timeline['pending'][event.request_id] = command
+        timeline['commands'].append(command)
+
+    def succeeded(self, event):
+        self._finish(event, True)
+
+    def failed(self, event):
+        self._finish(event, False)
+
+    def _finish(self, event, ok):
+        timeline = profile_timeline.get()
+        if timeline is None:
+            return
+        command = timeline['pending'].pop(event.request_id, None)
+        if command is not None:
+            command['duration_ms'] = round(event.duration_micros / 1000, 3)
+            command['ok'] = ok
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url,
+    serverSelectionTimeoutMS=int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+    connectTimeoutMS=int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '5000')),
+    socketTimeoutMS=int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', '10000')),
+    event_listeners=[MongoCommandTimeline()]
+)
 db = client[os.environ['DB_NAME']]
 
 # JWT Configuration
@@ -27,6 +81,13 @@ JWT_SECRET = os.environ.get('JWT_SECRET', 'mooki-store-secret-key-2024')
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
 
+# Order archive configuration
+ORDER_ARCHIVE_STATUSES = ["Completed", "Cancelled"]
+ORDER_ARCHIVE_AFTER_DAYS = int(os.environ.get('ORDER_ARCHIVE_AFTER_DAYS', '90'))
+ORDER_ARCHIVE_BATCH_SIZE = int(os.environ.get('ORDER_ARCHIVE_BATCH_SIZE', '500'))
+ORDER_ARCHIVE_INTERVAL_SECONDS = int(os.environ.get('ORDER_ARCHIVE_INTERVAL_SECONDS', '3600'))
+ORDER_ARCHIVE_BATCH_PAUSE_MS = int(os.environ.get('ORDER_ARCHIVE_BATCH_PAUSE_MS', '200'))
+
 # Security
 security = HTTPBearer()
 
@@ -43,6 +104,38 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Request profiling configuration
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', '500'))
+PROFILE_BUFFER_SIZE = int(os.environ.get('PROFILE_BUFFER_SIZE', '20'))
+
+# Rate limiting and load shedding configuration
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')  # memory, mongo
+RATE_LIMIT_LOGIN_PER_MINUTE = int(os.environ.get('RATE_LIMIT_LOGIN_PER_MINUTE', '10'))
+RATE_LIMIT_ORDERS_PER_MINUTE = int(os.environ.get('RATE_LIMIT_ORDERS_PER_MINUTE', '10'))
+RATE_LIMIT_CONTACT_PER_MINUTE = int(os.environ.get('RATE_LIMIT_CONTACT_PER_MINUTE', '5'))
+RATE_LIMIT_QUOTE_PER_MINUTE = int(os.environ.get('RATE_LIMIT_QUOTE_PER_MINUTE', '60'))
+CONCURRENCY_LIMIT_LOGIN = int(os.environ.get('CONCURRENCY_LIMIT_LOGIN', '8'))
+CONCURRENCY_LIMIT_WRITE = int(os.environ.get('CONCURRENCY_LIMIT_WRITE', '64'))
+CONCURRENCY_LIMIT_READ = int(os.environ.get('CONCURRENCY_LIMIT_READ', '256'))
+
+# Per-request deadline budgets in milliseconds, by route class
+DEADLINE_READ_MS = int(os.environ.get('DEADLINE_READ_MS', '3000'))
+DEADLINE_WRITE_MS = int(os.environ.get('DEADLINE_WRITE_MS', '5000'))
+DEADLINE_LOGIN_MS = int(os.environ.get('DEADLINE_LOGIN_MS', '3000'))
+DEADLINE_ADMIN_MS = int(os.environ.get('DEADLINE_ADMIN_MS', '60000'))
+RESEND_TIMEOUT_SECONDS = float(os.environ.get('RESEND_TIMEOUT_SECONDS', '10'))
+
+# Batched background writes for append-only collections
+BATCH_WRITER_MAX_BATCH = int(os.environ.get('BATCH_WRITER_MAX_BATCH', '100'))
+BATCH_WRITER_FLUSH_INTERVAL_MS = int(os.environ.get('BATCH_WRITER_FLUSH_INTERVAL_MS', '500'))
+BATCH_WRITER_MAX_QUEUE = int(os.environ.get('BATCH_WRITER_MAX_QUEUE', '10000'))
+
+# Sales rollup granularities mapped to the ISO timestamp prefix that names each bucket
+SALES_ROLLUP_GRANULARITIES = {"hour": 13, "day": 10}
+# A rebuild scans every order ever placed, far longer than MONGO_SOCKET_TIMEOUT_MS
+SALES_ROLLUP_REBUILD_TIMEOUT_SECONDS = int(os.environ.get('SALES_ROLLUP_REBUILD_TIMEOUT_SECONDS', '3600'))
+
 # ==================== MODELS ====================
 
 class ProductBase(BaseModel):
@@ -76,13 +169,36 @@ class OrderItem(BaseModel):
     quantity: int
     price: float
 
+class CartItem(BaseModel):
+    product_id: str
+    quantity: int = Field(gt=0)
+
+class CartQuoteRequest(BaseModel):
+    items: List[CartItem]
+
+class CartQuoteLine(BaseModel):
+    product_id: str
+    product_name: Optional[str] = None
+    quantity: int
+    price: float = 0
+    line_total: float = 0
+    available: bool
+    stock: int = 0
+    shortfall: int = 0
+
+class CartQuote(BaseModel):
+    items: List[CartQuoteLine]
+    total: float
+    valid: bool
+
 class OrderCreate(BaseModel):
     customer_name: str
     phone: str
     address: str
     email: Optional[str] = None
-    items: List[OrderItem]
-    total: float
+    # Names, prices and total are priced server-side; client values are ignored
+    items: List[CartItem]
+    total: Optional[float] = None
     payment_method: str = "Cash on Delivery"
 
 class Order(BaseModel):
@@ -98,6 +214,37 @@ class Order(BaseModel):
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class OrderEvent(BaseModel):
+    id: str
+    type: str  # order_created, order_status_changed, stock_decremented, stock_updated
+    order_id: Optional[str] = None
+    product_id: Optional[str] = None
+    quantity: Optional[int] = None
+    stock: Optional[int] = None
+    from_status: Optional[str] = None
+    to_status: Optional[str] = None
+    actor: Optional[str] = None
+    created_at: datetime
+
+class ProductCard(BaseModel):
+    id: str
+    name: str
+    flavor: str
+    nicotine_strength: str
+    price: float
+    stock: int
+    image_url: str
+    is_available: bool
+
+class OrderRow(BaseModel):
+    id: str
+    customer_name: str
+    phone: str
+    total: float
+    payment_method: str
+    status: str
+    created_at: datetime
+
 class OrderStatusUpdate(BaseModel):
     status: str
 
@@ -130,6 +277,24 @@ class TokenResponse(BaseModel):
     access_token: str
     token_type: str = "bearer"
 
+class SalesRollupStats(BaseModel):
+    units: int = 0
+    revenue: float = 0
+    orders: int = 0
+
+class SalesReportBucket(BaseModel):
+    bucket: str
+    product_id: str
+    product_name: Optional[str] = None
+    statuses: Dict[str, SalesRollupStats] = {}
+
+class SalesReport(BaseModel):
+    granularity: str
+    start: str
+    end: str
+    buckets: List[SalesReportBucket]
+    totals: Dict[str, SalesRollupStats]
+
 class EmailRequest(BaseModel):
     recipient_email: EmailStr
     subject: str
@@ -149,6 +314,52 @@ def create_access_token(data: dict) -> str:
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+# Predefined sparse views for list endpoints (?fields=card, ?fields=row)
+PRODUCT_VIEWS = {"card": ProductCard}
+ORDER_VIEWS = {"row": OrderRow}
+
+@lru_cache(maxsize=64)
+def sparse_model(model, fields: Tuple[str, ...]):
+    return create_model(
+        f"{model.__name__}Fields",
+        **{name: (Optional[model.model_fields[name].annotation], None) for name in fields}
+    )
+
+@lru_cache(maxsize=64)
+def list_adapter(model) -> TypeAdapter:
+    return TypeAdapter(List[model])
+
+# Map ?fields= (a view name or comma-separated field names) to a response model
+def resolve_fields(model, views: dict, fields: str):
+    if fields in views:
+        return views[fields]
+    names = tuple(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in model.model_fields]
+    if not names or unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid fields: {unknown or fields!r}. Use one of {list(views)} or a comma-separated list of: {list(model.model_fields)}"
+        )
+    return sparse_model(model, names)
+
+def fields_projection(view_model) -> dict:
+    return {"_id": 0, **{name: 1 for name in view_model.model_fields}}
+
+def json_list_response(view_model, docs: list) -> Response:
+    # Validate and serialize in pydantic-core; ISO date strings are parsed during validation
+    adapter = list_adapter(view_model)
+    return Response(content=adapter.dump_json(adapter.validate_python(docs)), media_type="application/json")
+
+def get_admin_from_header(authorization: Optional[str]) -> Optional[str]:
+    # Lenient variant of verify_token for middleware: returns None instead of raising
+    if not authorization or not authorization.lower().startswith("bearer "):
+        return None
+    try:
+        payload = jwt.decode(authorization[7:], JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    except jwt.PyJWTError:
+        return None
+    return payload.get("sub")
+
 async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
@@ -161,6 +372,127 @@ async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(secur
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+# ==================== BATCH WRITER ====================
+
+# Buffers documents for one collection; only the background task writes them with insert_many
+class BatchWriter:
+    def __init__(self, collection_name: str):
+        self.collection_name = collection_name
+        self.queue = asyncio.Queue(maxsize=BATCH_WRITER_MAX_QUEUE)
+        self.batch_ready = asyncio.Event()
+        # Set and replaced after every batch, so waiters can watch written catch up
+        self.batch_done = asyncio.Event()
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.closing = False
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        # Write everything still buffered before the Mongo client is closed
+        self.closing = True
+        self.batch_ready.set()
+        if self.task:
+            await self.task
+
+    async def put(self, doc: dict, route: str):
+        # Waits for room for at most the request's remaining budget, then answers 503
+        try:
+            await asyncio.wait_for(self.queue.put(doc), timeout=remaining_budget(DEADLINE_WRITE_MS / 1000))
+        except asyncio.TimeoutError:
+            record_deadline_exceeded(route, f"{self.collection_name} queue full")
+            raise HTTPException(status_code=503, detail="Server busy, please retry")
+        self.enqueued += 1
+        if self.queue.qsize() >= BATCH_WRITER_MAX_BATCH:
+            self.batch_ready.set()
+
+    # Never blocks; drops the document when the queue is full (audit records after a committed write)
+    def put_nowait(self, doc: dict):
+        try:
+            self.queue.put_nowait(doc)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.error(f"{self.collection_name} queue full, dropped document ({self.dropped} dropped so far)")
+            return
+        self.enqueued += 1
+        if self.queue.qsize() >= BATCH_WRITER_MAX_BATCH:
+            self.batch_ready.set()
+
+    # Wait (at most cap or the remaining budget) for everything enqueued so far to be written
+    async def wait_written(self, cap: float = 1.0):
+        if self.task is None or self.task.done():
+            return
+        target = self.enqueued
+        self.batch_ready.set()
+        try:
+            await asyncio.wait_for(self.wait_for_count(target), timeout=max(0, remaining_budget(cap)))
+        except asyncio.TimeoutError:
+            logger.warning(f"Timed out waiting for {self.collection_name} batch writer; reading without latest writes")
+
+    async def wait_for_count(self, target: int):
+        while self.written < target:
+            await self.batch_done.wait()
+
+    async def run(self):
+        while not self.closing:
+            try:
+                await asyncio.wait_for(self.batch_ready.wait(), timeout=BATCH_WRITER_FLUSH_INTERVAL_MS / 1000)
+            except asyncio.TimeoutError:
+                pass
+            self.batch_ready.clear()
+            await self.drain()
+        await self.drain()
+
+    async def drain(self):
+        while not self.queue.empty():
+            batch = []
+            while len(batch) < BATCH_WRITER_MAX_BATCH and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            await self.write(batch)
+            # Written or dropped, these documents are no longer pending
+            self.written += len(batch)
+            batch_done, self.batch_done = self.batch_done, asyncio.Event()
+            batch_done.set()
+
+    async def write(self, batch: list):
+        pending = batch
+        for attempt in range(3):
+            if attempt:
+                await asyncio.sleep(2 ** attempt)
+            try:
+                await db[self.collection_name].insert_many(pending, ordered=False)
+                return
+            except BulkWriteError as e:
+                # Retry only the documents that failed; a duplicate key means an earlier
+                # attempt already inserted that document (it keeps its _id between attempts)
+                failed = sorted({
+                    error['index'] for error in e.details.get('writeErrors', [])
+                    if error.get('code') != 11000
+                })
+                pending = [pending[index] for index in failed]
+                if not pending:
+                    return
+                logger.error(f"Batch write to {self.collection_name}: {len(pending)} documents failed (attempt {attempt + 1})")
+            except Exception as e:
+                logger.error(f"Batch write of {len(pending)} documents to {self.collection_name} failed (attempt {attempt + 1}): {e}")
+        self.dropped += len(pending)
+        logger.error(f"Dropped {len(pending)} documents for {self.collection_name} ({self.dropped} dropped so far)")
+
+contact_writer = BatchWriter("contact_messages")
+order_event_writer = BatchWriter("order_events")
+
+def record_order_event(event_type: str, **fields):
+    # Never blocks or raises: the order or stock change it describes is already committed
+    order_event_writer.put_nowait({
+        "id": str(uuid.uuid4()),
+        "type": event_type,
+        **fields,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    })
+
 # ==================== STARTUP ====================
 
 @app.on_event("startup")
@@ -186,9 +518,42 @@ async def startup_event():
         doc['created_at'] = doc['created_at'].isoformat()
         await db.admins.insert_one(doc)
         logger.info("Default admin created (username: admin, password: admin123)")
+    
+    # Indexes for the hot order collection and its archive
+    await db.orders.create_index("id")
+    await db.orders.create_index([("created_at", -1)])
+    await db.orders.create_index([("status", 1), ("updated_at", 1)])
+    await db.orders_archive.create_index("id", unique=True)
+    await db.orders_archive.create_index([("created_at", -1)])
+    await db.sales_rollups.create_index([("granularity", 1), ("bucket", 1), ("product_id", 1)], unique=True)
+    # Backfill rollups for orders placed before they existed, or status changes would
+    # subtract orders that were never counted
+    if not await db.sales_rollups.find_one({}, {"_id": 1}) and (
+        await db.orders.find_one({}, {"_id": 1}) or await db.orders_archive.find_one({}, {"_id": 1})
+    ):
+        await rebuild_sales_rollups()
+    if RATE_LIMIT_BACKEND == "mongo":
+        await db.rate_limits.create_index("updated_at", expireAfterSeconds=3600)
+    await db.order_events.create_index([("order_id", 1), ("created_at", -1)])
+    await db.order_events.create_index([("product_id", 1), ("created_at", -1)])
+    await db.order_events.create_index([("created_at", -1)])
+    
+    # Start the background order archiver and batch writers
+    app.state.archive_task = asyncio.create_task(order_archive_loop())
+    contact_writer.start()
+    order_event_writer.start()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    archive_task = getattr(app.state, "archive_task", None)
+    if archive_task:
+        archive_task.cancel()
+        try:
+            await archive_task
+        except asyncio.CancelledError:
+            pass
+    await contact_writer.stop()
+    await order_event_writer.stop()
     client.close()
 
 # ==================== PRODUCT ENDPOINTS ====================
@@ -197,15 +562,18 @@ async def shutdown_db_client():
 async def root():
     return {"message": "MOOKI STORE API"}
 
-@api_router.get("/products", response_model=List[Product])
-async def get_all_products():
-    products = await db.products.find({}, {"_id": 0}).to_list(100)
-    for product in products:
-        if isinstance(product.get('created_at'), str):
-            product['created_at'] = datetime.fromisoformat(product['created_at'])
-        if isinstance(product.get('updated_at'), str):
-            product['updated_at'] = datetime.fromisoformat(product['updated_at'])
-    return products
+@api_router.get(
+    "/products",
+    response_model=None,
+    responses={200: {
+        "model": Union[List[Product], List[ProductCard]],
+        "description": "Full products, the card view (?fields=card), or only the fields listed in ?fields=a,b,c",
+    }}
+)
+async def get_all_products(fields: Optional[str] = None):
+    view = resolve_fields(Product, PRODUCT_VIEWS, fields) if fields else Product
+    products = await db.products.find({}, fields_projection(view)).to_list(100)
+    return json_list_response(view, products)
 
 @api_router.get("/product", response_model=Product)
 async def get_product():
@@ -247,6 +615,8 @@ async def update_product(product_id: str, update: ProductUpdate, admin: str = De
     result = await db.products.update_one({"id": product_id}, {"$set": update_data})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
+    if update.stock is not None:
+        record_order_event("stock_updated", product_id=product_id, stock=update.stock, actor=admin)
     return await get_product_by_id(product_id)
 
 @api_router.put("/product", response_model=Product)
@@ -256,7 +626,10 @@ async def update_first_product(update: ProductUpdate, admin: str = Depends(verif
     update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
     
     await db.products.update_one({}, {"$set": update_data})
-    return await get_product()
+    product = await get_product()
+    if update.stock is not None:
+        record_order_event("stock_updated", product_id=product['id'], stock=update.stock, actor=admin)
+    return product
 
 @api_router.delete("/product/{product_id}")
 async def delete_product(product_id: str, admin: str = Depends(verify_token)):
@@ -265,54 +638,125 @@ async def delete_product(product_id: str, admin: str = Depends(verify_token)):
         raise HTTPException(status_code=404, detail="Product not found")
     return {"message": "Product deleted successfully"}
 
+# ==================== CART ENDPOINTS ====================
+
+# Price a cart with one $in query; lines for the same product are merged before the stock check
+async def price_cart(items: List[CartItem]) -> CartQuote:
+    quantities = {}
+    for item in items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    
+    products = await db.products.find(
+        {"id": {"$in": list(quantities)}},
+        {"_id": 0, "id": 1, "name": 1, "price": 1, "stock": 1, "is_available": 1}
+    ).to_list(len(quantities))
+    catalog = {product['id']: product for product in products}
+    
+    lines = []
+    for product_id, quantity in quantities.items():
+        product = catalog.get(product_id)
+        if not product:
+            lines.append(CartQuoteLine(product_id=product_id, quantity=quantity, available=False, shortfall=quantity))
+            continue
+        stock = product.get('stock', 0)
+        lines.append(CartQuoteLine(
+            product_id=product_id,
+            product_name=product.get('name'),
+            quantity=quantity,
+            price=product.get('price', 0),
+            line_total=round(product.get('price', 0) * quantity, 2),
+            available=bool(product.get('is_available')),
+            stock=stock,
+            shortfall=max(0, quantity - stock)
+        ))
+    
+    return CartQuote(
+        items=lines,
+        total=round(sum(line.line_total for line in lines), 2),
+        valid=bool(lines) and all(line.available and line.shortfall == 0 for line in lines)
+    )
+
+@api_router.post("/cart/quote", response_model=CartQuote)
+async def quote_cart(cart: CartQuoteRequest):
+    return await price_cart(cart.items)
+
 # ==================== ORDER ENDPOINTS ====================
 
 @api_router.post("/orders", response_model=Order)
 async def create_order(order_data: OrderCreate):
-    # Check product availability and stock for each item
-    for item in order_data.items:
-        product = await db.products.find_one({"id": item.product_id}, {"_id": 0})
-        if not product or not product.get('is_available'):
-            raise HTTPException(status_code=400, detail=f"Product {item.product_name} not available")
-        if product.get('stock', 0) < item.quantity:
-            raise HTTPException(status_code=400, detail=f"Insufficient stock for {item.product_name}")
-    
-    order = Order(**order_data.model_dump())
+    if not order_data.items:
+        raise HTTPException(status_code=400, detail="Order has no items")
+    
+    # Check product availability and stock for the whole cart at once
+    quote = await price_cart(order_data.items)
+    for line in quote.items:
+        if not line.available:
+            raise HTTPException(status_code=400, detail=f"Product {line.product_name or line.product_id} not available")
+        if line.shortfall:
+            raise HTTPException(status_code=400, detail=f"Insufficient stock for {line.product_name}")
+    
+    order = Order(
+        **order_data.model_dump(exclude={"items", "total"}),
+        items=[
+            OrderItem(product_id=line.product_id, product_name=line.product_name, quantity=line.quantity, price=line.price)
+            for line in quote.items
+        ],
+        total=quote.total
+    )
     doc = order.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
     doc['updated_at'] = doc['updated_at'].isoformat()
     
     await db.orders.insert_one(doc)
+    await apply_sales_rollup(doc, order.status, 1)
+    
+    record_order_event("order_created", order_id=order.id, to_status=order.status)
     
-    # Update stock for each item
-    for item in order_data.items:
-        await db.products.update_one(
-            {"id": item.product_id},
-            {"$inc": {"stock": -item.quantity}}
+    # Update stock for every item in one round trip. The order is already placed, so a
+    # timeout here must not turn into a 503 that makes the shopper order again
+    try:
+        await db.products.bulk_write(
+            [UpdateOne({"id": item.product_id}, {"$inc": {"stock": -item.quantity}}) for item in order.items],
+            ordered=False
         )
+    except MONGO_TIMEOUT_ERRORS as e:
+        record_deadline_exceeded("/api/orders", type(e).__name__)
+        logger.error(f"Stock update for order {order.id} timed out; check stock for {[item.product_id for item in order.items]}")
+    else:
+        for item in order.items:
+            record_order_event("stock_decremented", order_id=order.id, product_id=item.product_id, quantity=item.quantity)
     
     # Send confirmation email if email provided
     if order_data.email:
         try:
             await send_order_confirmation_email(order, order_data.email)
+        except asyncio.TimeoutError:
+            # The order is already placed; a slow email must not fail it
+            record_deadline_exceeded("/api/orders", "resend")
         except Exception as e:
             logger.error(f"Failed to send confirmation email: {e}")
     
     return order
 
-@api_router.get("/orders", response_model=List[Order])
-async def get_orders(admin: str = Depends(verify_token)):
-    orders = await db.orders.find({}, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    for order in orders:
-        if isinstance(order.get('created_at'), str):
-            order['created_at'] = datetime.fromisoformat(order['created_at'])
-        if isinstance(order.get('updated_at'), str):
-            order['updated_at'] = datetime.fromisoformat(order['updated_at'])
-    return orders
+@api_router.get(
+    "/orders",
+    response_model=None,
+    responses={200: {
+        "model": Union[List[Order], List[OrderRow]],
+        "description": "Full orders, the row view (?fields=row), or only the fields listed in ?fields=a,b,c",
+    }}
+)
+async def get_orders(fields: Optional[str] = None, admin: str = Depends(verify_token)):
+    view = resolve_fields(Order, ORDER_VIEWS, fields) if fields else Order
+    orders = await db.orders.find({}, fields_projection(view)).sort("created_at", -1).to_list(1000)
+    return json_list_response(view, orders)
 
 @api_router.get("/orders/{order_id}", response_model=Order)
 async def get_order(order_id: str):
     order = await db.orders.find_one({"id": order_id}, {"_id": 0})
+    if not order:
+        # Old finished orders live in the archive
+        order = await db.orders_archive.find_one({"id": order_id}, {"_id": 0, "archived_at": 0})
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     if isinstance(order.get('created_at'), str):
@@ -327,15 +771,286 @@ async def update_order_status(order_id: str, status_update: OrderStatusUpdate, a
     if status_update.status not in valid_statuses:
         raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of: {valid_statuses}")
     
-    result = await db.orders.update_one(
+    if not await db.orders.find_one({"id": order_id}, {"_id": 1}):
+        # Editing an archived order moves it back into the hot collection
+        await restore_archived_order(order_id)
+    
+    updated_at = datetime.now(timezone.utc)
+    previous = await db.orders.find_one_and_update(
         {"id": order_id},
-        {"$set": {"status": status_update.status, "updated_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"status": status_update.status, "updated_at": updated_at.isoformat()}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.BEFORE
     )
     
-    if result.matched_count == 0:
+    if previous is None:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    return await get_order(order_id)
+    if previous.get('status') != status_update.status:
+        await apply_sales_rollup(previous, previous.get('status', 'Pending'), -1)
+        await apply_sales_rollup(previous, status_update.status, 1)
+        record_order_event(
+            "order_status_changed",
+            order_id=order_id,
+            from_status=previous.get('status'),
+            to_status=status_update.status,
+            actor=admin
+        )
+    
+    # Build the response from the pre-update document; re-reading after the write could
+    # time out and report a 503 for a change that was already saved
+    order = {**previous, "status": status_update.status, "updated_at": updated_at}
+    if isinstance(order.get('created_at'), str):
+        order['created_at'] = datetime.fromisoformat(order['created_at'])
+    return order
+
+# ==================== ORDER ARCHIVE ====================
+
+# Move old finished orders to orders_archive in batches; upsert before delete so reruns are safe
+async def archive_old_orders() -> int:
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=ORDER_ARCHIVE_AFTER_DAYS)).isoformat()
+    query = {"status": {"$in": ORDER_ARCHIVE_STATUSES}, "updated_at": {"$lt": cutoff}}
+    archived = 0
+    
+    while True:
+        orders = await db.orders.find(query, {"_id": 0}).limit(ORDER_ARCHIVE_BATCH_SIZE).to_list(ORDER_ARCHIVE_BATCH_SIZE)
+        if not orders:
+            break
+        
+        archived_at = datetime.now(timezone.utc).isoformat()
+        await db.orders_archive.bulk_write(
+            [ReplaceOne({"id": order['id']}, {**order, "archived_at": archived_at}, upsert=True) for order in orders],
+            ordered=False
+        )
+        ids = [order['id'] for order in orders]
+        result = await db.orders.delete_many({**query, "id": {"$in": ids}})
+        if result.deleted_count < len(ids):
+            survivors = await db.orders.find({"id": {"$in": ids}}, {"_id": 0, "id": 1}).to_list(len(ids))
+            await db.orders_archive.delete_many({"id": {"$in": [order['id'] for order in survivors]}})
+        
+        archived += result.deleted_count
+        # Pause between batches to leave Mongo capacity for storefront traffic
+        await asyncio.sleep(ORDER_ARCHIVE_BATCH_PAUSE_MS / 1000)
+    
+    if archived:
+        logger.info(f"Archived {archived} orders older than {ORDER_ARCHIVE_AFTER_DAYS} days")
+    return archived
+
+async def restore_archived_order(order_id: str) -> bool:
+    order = await db.orders_archive.find_one({"id": order_id}, {"_id": 0, "archived_at": 0})
+    if not order:
+        return False
+    await db.orders.replace_one({"id": order_id}, order, upsert=True)
+    await db.orders_archive.delete_one({"id": order_id})
+    logger.info(f"Restored order {order_id} from archive")
+    return True
+
+async def order_archive_loop():
+    while True:
+        try:
+            await archive_old_orders()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Order archive run failed: {e}")
+        await asyncio.sleep(ORDER_ARCHIVE_INTERVAL_SECONDS)
+
+@api_router.get("/admin/orders/archive", response_model=List[Order])
+async def get_archived_orders(
+    status: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    admin: str = Depends(verify_token)
+):
+    query = {}
+    if status:
+        query['status'] = status
+    if start or end:
+        query['created_at'] = {}
+        if start:
+            query['created_at']['$gte'] = start.isoformat()
+        if end:
+            query['created_at']['$lt'] = end.isoformat()
+    
+    orders = await db.orders_archive.find(query, {"_id": 0, "archived_at": 0}).sort("created_at", -1).skip(skip).to_list(limit)
+    for order in orders:
+        if isinstance(order.get('created_at'), str):
+            order['created_at'] = datetime.fromisoformat(order['created_at'])
+        if isinstance(order.get('updated_at'), str):
+            order['updated_at'] = datetime.fromisoformat(order['updated_at'])
+    return orders
+
+@api_router.post("/admin/orders/archive/run")
+async def run_order_archive(admin: str = Depends(verify_token)):
+    archived = await archive_old_orders()
+    return {"message": "Archive run complete", "archived": archived}
+
+# ==================== SALES REPORTS ====================
+
+# Add (sign=1) or remove (sign=-1) an order from its created_at buckets; errors are only logged
+async def apply_sales_rollup(order: dict, order_status: str, sign: int):
+    lines = {}
+    for item in order.get('items', []):
+        line = lines.setdefault(item['product_id'], {"product_name": item.get('product_name'), "units": 0, "revenue": 0.0})
+        line['units'] += item['quantity']
+        line['revenue'] += item['quantity'] * item['price']
+    
+    created_at = order['created_at']
+    if not isinstance(created_at, str):
+        created_at = created_at.isoformat()
+    
+    operations = []
+    for granularity, prefix in SALES_ROLLUP_GRANULARITIES.items():
+        for product_id, line in lines.items():
+            operations.append(UpdateOne(
+                {"granularity": granularity, "bucket": created_at[:prefix], "product_id": product_id},
+                {
+                    "$inc": {
+                        f"statuses.{order_status}.units": sign * line['units'],
+                        f"statuses.{order_status}.revenue": sign * line['revenue'],
+                        f"statuses.{order_status}.orders": sign,
+                    },
+                    "$set": {"product_name": line['product_name']},
+                },
+                upsert=True
+            ))
+    
+    if not operations:
+        return
+    try:
+        await db.sales_rollups.bulk_write(operations, ordered=False)
+    except Exception as e:
+        logger.error(f"Failed to update sales rollups for order {order.get('id')}: {e}")
+
+# Rebuild sales_rollups in a scratch collection and swap it in; increments made meanwhile are lost
+async def rebuild_sales_rollups() -> int:
+    # Overrides the client socket timeout (and any shorter request deadline still wins)
+    with pymongo.timeout(SALES_ROLLUP_REBUILD_TIMEOUT_SECONDS):
+        rollups = {}
+        for granularity, prefix in SALES_ROLLUP_GRANULARITIES.items():
+            pipeline = [
+                {"$unwind": "$items"},
+                # One row per order and product first, so an order counts once per product
+                {"$group": {
+                    "_id": {
+                        "bucket": {"$substrBytes": ["$created_at", 0, prefix]},
+                        "product_id": "$items.product_id",
+                        "status": "$status",
+                        "order_id": "$id",
+                    },
+                    "product_name": {"$last": "$items.product_name"},
+                    "units": {"$sum": "$items.quantity"},
+                    "revenue": {"$sum": {"$multiply": ["$items.quantity", "$items.price"]}},
+                }},
+                {"$group": {
+                    "_id": {"bucket": "$_id.bucket", "product_id": "$_id.product_id", "status": "$_id.status"},
+                    "product_name": {"$last": "$product_name"},
+                    "units": {"$sum": "$units"},
+                    "revenue": {"$sum": "$revenue"},
+                    "orders": {"$sum": 1},
+                }},
+            ]
+            for collection in (db.orders, db.orders_archive):
+                async for row in collection.aggregate(pipeline):
+                    key = (granularity, row['_id']['bucket'], row['_id']['product_id'])
+                    rollup = rollups.setdefault(key, {
+                        "granularity": granularity,
+                        "bucket": row['_id']['bucket'],
+                        "product_id": row['_id']['product_id'],
+                        "product_name": row['product_name'],
+                        "statuses": {},
+                    })
+                    stats = rollup['statuses'].setdefault(row['_id']['status'], {"units": 0, "revenue": 0.0, "orders": 0})
+                    stats['units'] += row['units']
+                    stats['revenue'] += row['revenue']
+                    stats['orders'] += row['orders']
+    
+        # A scratch name per run, so workers rebuilding at the same time do not collide
+        scratch = db[f"sales_rollups_rebuild_{uuid.uuid4().hex[:12]}"]
+        if rollups:
+            await scratch.insert_many(list(rollups.values()))
+            await scratch.rename("sales_rollups", dropTarget=True)
+        else:
+            await db.sales_rollups.delete_many({})
+        await db.sales_rollups.create_index([("granularity", 1), ("bucket", 1), ("product_id", 1)], unique=True)
+    
+    logger.info(f"Rebuilt {len(rollups)} sales rollup buckets")
+    return len(rollups)
+
+@api_router.get("/admin/reports", response_model=SalesReport)
+async def get_sales_report(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    granularity: str = "day",
+    product_id: Optional[str] = None,
+    admin: str = Depends(verify_token)
+):
+    if granularity not in SALES_ROLLUP_GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"Invalid granularity. Must be one of: {list(SALES_ROLLUP_GRANULARITIES)}")
+    
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(days=30)
+    if start.tzinfo:
+        start = start.astimezone(timezone.utc)
+    if end.tzinfo:
+        end = end.astimezone(timezone.utc)
+    prefix = SALES_ROLLUP_GRANULARITIES[granularity]
+    start_bucket = start.isoformat()[:prefix]
+    end_bucket = end.isoformat()[:prefix]
+    
+    query = {"granularity": granularity, "bucket": {"$gte": start_bucket, "$lte": end_bucket}}
+    if product_id:
+        query['product_id'] = product_id
+    
+    buckets = await db.sales_rollups.find(query, {"_id": 0, "granularity": 0}).sort("bucket", 1).to_list(None)
+    
+    totals = {}
+    for bucket in buckets:
+        # Status changes leave zeroed counters behind; they are noise in a report
+        bucket['statuses'] = {
+            order_status: stats for order_status, stats in bucket.get('statuses', {}).items()
+            if stats.get('orders') or stats.get('units')
+        }
+        for order_status, stats in bucket['statuses'].items():
+            total = totals.setdefault(order_status, {"units": 0, "revenue": 0.0, "orders": 0})
+            total['units'] += stats.get('units', 0)
+            total['revenue'] += stats.get('revenue', 0)
+            total['orders'] += stats.get('orders', 0)
+            stats['revenue'] = round(stats.get('revenue', 0), 2)
+    for total in totals.values():
+        total['revenue'] = round(total['revenue'], 2)
+    
+    buckets = [bucket for bucket in buckets if bucket['statuses']]
+    return SalesReport(granularity=granularity, start=start_bucket, end=end_bucket, buckets=buckets, totals=totals)
+
+@api_router.post("/admin/reports/rebuild")
+async def rebuild_sales_report(admin: str = Depends(verify_token)):
+    buckets = await rebuild_sales_rollups()
+    return {"message": "Sales rollups rebuilt", "buckets": buckets}
+
+# ==================== ORDER EVENTS ====================
+
+@api_router.get("/admin/events", response_model=List[OrderEvent])
+async def get_order_events(
+    order_id: Optional[str] = None,
+    product_id: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    admin: str = Depends(verify_token)
+):
+    await order_event_writer.wait_written()
+    query = {}
+    if order_id:
+        query['order_id'] = order_id
+    if product_id:
+        query['product_id'] = product_id
+    
+    events = await db.order_events.find(query, {"_id": 0}).sort("created_at", -1).to_list(limit)
+    for event in events:
+        if isinstance(event.get('created_at'), str):
+            event['created_at'] = datetime.fromisoformat(event['created_at'])
+    return events
 
 # ==================== CONTACT ENDPOINTS ====================
 
@@ -345,11 +1060,13 @@ async def create_contact_message(message_data: ContactMessageCreate):
     doc = message.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
     
-    await db.contact_messages.insert_one(doc)
+    await contact_writer.put(doc, "/api/contact")
     return message
 
 @api_router.get("/contact", response_model=List[ContactMessage])
 async def get_contact_messages(admin: str = Depends(verify_token)):
+    # Make sure the admin sees messages still waiting in the batch writer
+    await contact_writer.wait_written()
     messages = await db.contact_messages.find({}, {"_id": 0}).sort("created_at", -1).to_list(1000)
     for msg in messages:
         if isinstance(msg.get('created_at'), str):
@@ -358,6 +1075,7 @@ async def get_contact_messages(admin: str = Depends(verify_token)):
 
 @api_router.put("/contact/{message_id}/read")
 async def mark_message_read(message_id: str, admin: str = Depends(verify_token)):
+    await contact_writer.wait_written()
     result = await db.contact_messages.update_one(
         {"id": message_id},
         {"$set": {"is_read": True}}
@@ -381,6 +1099,269 @@ async def admin_login(login_data: AdminLogin):
 async def verify_admin(admin: str = Depends(verify_token)):
     return {"valid": True, "username": admin}
 
+# ==================== PROFILING ====================
+
+# Most recent captured profiles, oldest dropped first
+profiles = deque(maxlen=PROFILE_BUFFER_SIZE)
+# cProfile traces the whole event loop thread, so only one profile runs at a time
+profiler_lock = asyncio.Lock()
+# Requests currently in the app, and how many overlapped the running profile
+request_activity = {"active": 0, "overlapping": 0}
+
+# Profile admin-requested (X-Profile: 1 / ?profile=1) or sampled slow requests
+@app.middleware("http")
+async def profile_requests(request, call_next):
+    request_activity['active'] += 1
+    try:
+        if profiler_lock.locked():
+            request_activity['overlapping'] += 1
+        
+        requested = request.headers.get("x-profile") == "1" or request.query_params.get("profile") == "1"
+        if requested and not get_admin_from_header(request.headers.get("authorization")):
+            requested = False
+        others = request_activity['active'] - 1
+        sampled = not requested and PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+        
+        if not (requested or sampled) or profiler_lock.locked():
+            return await call_next(request)
+        
+        async with profiler_lock:
+            request_activity['overlapping'] = others
+            timeline = {"start": time.perf_counter(), "commands": [], "pending": {}}
+            token = profile_timeline.set(timeline)
+            profiler = cProfile.Profile()
+            started_at = datetime.now(timezone.utc)
+            profiler.enable()
+            try:
+                response = await call_next(request)
+            finally:
+                profiler.disable()
+                profile_timeline.reset(token)
+            duration_ms = (time.perf_counter() - timeline['start']) * 1000
+            overlapping = request_activity['overlapping']
+    finally:
+        request_activity['active'] -= 1
+    
+    if requested or duration_ms >= PROFILE_SLOW_MS:
+        profiler.create_stats()
+        profile_id = str(uuid.uuid4())
+        profiles.append({
+            "id": profile_id,
+            "method": request.method,
+            "path": request.url.path,
+            "status_code": response.status_code,
+            "duration_ms": round(duration_ms, 3),
+            "started_at": started_at.isoformat(),
+            "trigger": "requested" if requested else "sampled",
+            "overlapping_requests": overlapping,
+            "mongo_commands": timeline['commands'],
+            "stats": marshal.dumps(profiler.stats),
+        })
+        response.headers["X-Profile-Id"] = profile_id
+        if duration_ms >= PROFILE_SLOW_MS:
+            logger.warning(f"Slow request {request.method} {request.url.path} took {duration_ms:.0f}ms (profile {profile_id})")
+    return response
+
+def find_profile(profile_id: str) -> dict:
+    for profile in profiles:
+        if profile['id'] == profile_id:
+            return profile
+    raise HTTPException(status_code=404, detail="Profile not found")
+
+@api_router.get("/admin/profiles")
+async def get_profiles(admin: str = Depends(verify_token)):
+    return [
+        {**{k: v for k, v in profile.items() if k not in ("stats", "mongo_commands")}, "mongo_command_count": len(profile['mongo_commands'])}
+        for profile in reversed(profiles)
+    ]
+
+@api_router.get("/admin/profiles/{profile_id}")
+async def get_profile_detail(profile_id: str, top: int = Query(30, ge=1, le=500), admin: str = Depends(verify_token)):
+    profile = find_profile(profile_id)
+    output = io.StringIO()
+    stats = pstats.Stats(stream=output)
+    stats.stats = marshal.loads(profile['stats'])
+    stats.get_top_level_stats()
+    stats.sort_stats("cumulative").print_stats(top)
+    return {**{k: v for k, v in profile.items() if k != "stats"}, "top_functions": output.getvalue()}
+
+@api_router.get("/admin/profiles/{profile_id}/download")
+async def download_profile(profile_id: str, admin: str = Depends(verify_token)):
+    # Same format as cProfile's dump_stats: open with pstats, snakeviz, etc.
+    profile = find_profile(profile_id)
+    return Response(
+        content=profile['stats'],
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f"attachment; filename=profile-{profile_id}.prof"}
+    )
+
+# ==================== RATE LIMITING ====================
+
+# Per-worker token buckets, LRU-evicted past max_keys
+class InMemoryRateLimitBackend:
+    max_keys = 10000
+
+    def __init__(self):
+        self.buckets = OrderedDict()
+
+    # Take one token; returns 0 if allowed, else seconds to wait
+    async def take(self, key: str, per_minute: int) -> float:
+        now = time.monotonic()
+        rate = per_minute / 60
+        tokens, updated = self.buckets.pop(key, (per_minute, now))
+        tokens = min(per_minute, tokens + (now - updated) * rate)
+        
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        # Re-inserting moves the key to the most recently used end
+        self.buckets[key] = (tokens, now)
+        if len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        
+        return 0 if allowed else (1 - tokens) / rate
+
+# Token buckets shared by all workers; one atomic update per take, TTL-expired when idle
+class MongoRateLimitBackend:
+    async def take(self, key: str, per_minute: int) -> float:
+        now = datetime.now(timezone.utc)
+        rate = per_minute / 60
+        refilled = {"$min": [per_minute, {"$add": [
+            {"$ifNull": ["$tokens", per_minute]},
+            {"$multiply": [{"$divide": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]}, rate]},
+        ]}]}
+        bucket = await db.rate_limits.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "updated_at": now}},
+                {"$set": {
+                    "allowed": {"$gte": ["$tokens", 1]},
+                    "tokens": {"$cond": [{"$gte": ["$tokens", 1]}, {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                }},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if bucket['allowed']:
+            return 0
+        return (1 - bucket['tokens']) / rate
+
+rate_limit_backend = MongoRateLimitBackend() if RATE_LIMIT_BACKEND == "mongo" else InMemoryRateLimitBackend()
+
+# Requests per minute per client IP for public write endpoints
+RATE_LIMITS = {
+    ("POST", "/api/auth/login"): RATE_LIMIT_LOGIN_PER_MINUTE,
+    ("POST", "/api/orders"): RATE_LIMIT_ORDERS_PER_MINUTE,
+    ("POST", "/api/contact"): RATE_LIMIT_CONTACT_PER_MINUTE,
+    ("POST", "/api/cart/quote"): RATE_LIMIT_QUOTE_PER_MINUTE,
+}
+
+# Maximum requests in flight per route class before new ones are shed
+CONCURRENCY_LIMITS = {"login": CONCURRENCY_LIMIT_LOGIN, "write": CONCURRENCY_LIMIT_WRITE, "read": CONCURRENCY_LIMIT_READ}
+in_flight = {route_class: 0 for route_class in CONCURRENCY_LIMITS}
+
+def get_route_class(method: str, path: str) -> str:
+    if path == "/api/auth/login":
+        return "login"
+    if method in ("POST", "PUT", "DELETE"):
+        return "write"
+    return "read"
+
+# Shed load per route class (503), then per-IP token buckets (429); neither queues
+@app.middleware("http")
+async def limit_requests(request, call_next):
+    method, path = request.method, request.url.path
+    if method == "OPTIONS" or not path.startswith("/api"):
+        return await call_next(request)
+    
+    route_class = get_route_class(method, path)
+    if in_flight[route_class] >= CONCURRENCY_LIMITS[route_class]:
+        logger.warning(f"Shedding {method} {path}: {in_flight[route_class]} {route_class} requests in flight")
+        return JSONResponse(status_code=503, content={"detail": "Server busy, please retry"}, headers={"Retry-After": "1"})
+    
+    in_flight[route_class] += 1
+    try:
+        per_minute = RATE_LIMITS.get((method, path))
+        if per_minute:
+            # Real client address when uvicorn runs with --proxy-headers (see render.yaml / Dockerfile)
+            client_ip = request.client.host if request.client else "unknown"
+            try:
+                retry_after = await rate_limit_backend.take(f"{method}:{path}:{client_ip}", per_minute)
+            except Exception as e:
+                # Fail open: a broken limiter must not take the store down with it
+                logger.error(f"Rate limiter failed: {e}")
+                retry_after = 0
+            if retry_after:
+                return JSONResponse(
+                    status_code=429,
+                    content={"detail": "Too many requests, please slow down"},
+                    headers={"Retry-After": str(int(retry_after) + 1)}
+                )
+        return await call_next(request)
+    finally:
+        # Released once headers are ready; the small JSON bodies go out right after
+        in_flight[route_class] -= 1
+
+# ==================== DEADLINES ====================
+
+# time.monotonic() deadline of the current request, if any
+request_deadline = contextvars.ContextVar('request_deadline', default=None)
+
+DEADLINE_BUDGETS = {"login": DEADLINE_LOGIN_MS, "write": DEADLINE_WRITE_MS, "read": DEADLINE_READ_MS}
+
+# Requests that ran out of budget, by route template (never the raw path, which
+# would add a key per order id)
+deadline_exceeded = {}
+
+def get_deadline_budget(method: str, path: str) -> int:
+    # Admin reports, archive runs and rebuilds scan far more data than storefront routes
+    if path.startswith("/api/admin/"):
+        return DEADLINE_ADMIN_MS
+    return DEADLINE_BUDGETS[get_route_class(method, path)]
+
+# Seconds left before the current request's deadline, at most cap
+def remaining_budget(cap: float) -> float:
+    deadline = request_deadline.get()
+    if deadline is None:
+        return cap
+    return min(cap, deadline - time.monotonic())
+
+def get_route_template(request) -> str:
+    route = request.scope.get("route")
+    if route is not None:
+        return route.path
+    return get_route_class(request.method, request.url.path)
+
+MONGO_TIMEOUT_ERRORS = (ExecutionTimeout, NetworkTimeout, ServerSelectionTimeoutError, WTimeoutError)
+
+def record_deadline_exceeded(route: str, cause: str):
+    deadline_exceeded[route] = deadline_exceeded.get(route, 0) + 1
+    logger.warning(
+        f"Deadline exceeded on {route} ({cause}): {deadline_exceeded[route]} times on this route, "
+        f"{sum(deadline_exceeded.values())} in total"
+    )
+
+# Mongo calls get the remaining budget via pymongo.timeout; running out answers 503
+@app.middleware("http")
+async def enforce_deadlines(request, call_next):
+    if not request.url.path.startswith("/api"):
+        return await call_next(request)
+    
+    budget = get_deadline_budget(request.method, request.url.path) / 1000
+    token = request_deadline.set(time.monotonic() + budget)
+    try:
+        with pymongo.timeout(budget):
+            return await call_next(request)
+    finally:
+        request_deadline.reset(token)
+
+async def handle_mongo_timeout(request, exc):
+    record_deadline_exceeded(get_route_template(request), type(exc).__name__)
+    return JSONResponse(status_code=503, content={"detail": "Service temporarily unavailable, please retry"}, headers={"Retry-After": "1"})
+
+for timeout_error in MONGO_TIMEOUT_ERRORS:
+    app.add_exception_handler(timeout_error, handle_mongo_timeout)
+
 # ==================== EMAIL SERVICE ====================
 
 async def send_order_confirmation_email(order: Order, recipient_email: str):
@@ -448,7 +1429,7 @@ async def send_order_confirmation_email(order: Order, recipient_email: str):
             "html": html_content
         }
         
-        await asyncio.to_thread(resend.Emails.send, params)
+        await asyncio.wait_for(asyncio.to_thread(resend.Emails.send, params), timeout=remaining_budget(RESEND_TIMEOUT_SECONDS))
         logger.info(f"Order confirmation email sent to {recipient_email}")
         
     except Exception as e:
@@ -475,9 +1456,12 @@ async def send_test_email(request: EmailRequest, admin: str = Depends(verify_tok
             "html": request.html_content
         }
         
-        email = await asyncio.to_thread(resend.Emails.send, params)
+        email = await asyncio.wait_for(asyncio.to_thread(resend.Emails.send, params), timeout=remaining_budget(RESEND_TIMEOUT_SECONDS))
         return {"status": "success", "email_id": email.get("id")}
         
+    except asyncio.TimeoutError:
+        record_deadline_exceeded("/api/send-test-email", "resend")
+        raise HTTPException(status_code=503, detail="Email service timed out")
     except Exception as e:
         logger.error(f"Failed to send email: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to send email: {str(e)}")
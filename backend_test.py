@@ -79,6 +79,13 @@ class MookiStoreAPITester:
             print(f"   Stock: {response.get('stock')}")
         return success
 
+    def test_get_product_cards(self):
+        """Test the sparse card view of the product list"""
+        success, response = self.run_test("Get Product Cards", "GET", "products?fields=card", 200)
+        if success and response:
+            print(f"   Card Fields: {sorted(response[0].keys())}")
+        return success
+
     def test_admin_login(self):
         """Test admin login"""
         login_data = {
@@ -98,6 +105,19 @@ class MookiStoreAPITester:
             return False
         return self.run_test("Admin Verify", "GET", "auth/verify", 200)[0]
 
+    def test_cart_quote(self):
+        """Test pricing a cart server-side"""
+        if not self.product_id:
+            self.log_test("Cart Quote", False, "No product ID available")
+            return False
+            
+        cart_data = {"items": [{"product_id": self.product_id, "quantity": 2}]}
+        success, response = self.run_test("Cart Quote", "POST", "cart/quote", 200, cart_data)
+        if success and response:
+            print(f"   Quoted Total: ${response.get('total')}")
+            print(f"   Valid: {response.get('valid')}")
+        return success
+
     def test_create_order(self):
         """Test creating an order"""
         if not self.product_id:
@@ -150,6 +170,40 @@ class MookiStoreAPITester:
         status_data = {"status": "Confirmed"}
         return self.run_test("Update Order Status", "PUT", f"orders/{self.order_id}/status", 200, status_data)[0]
 
+    def test_get_archived_orders(self):
+        """Test querying archived orders (admin only)"""
+        if not self.token:
+            self.log_test("Get Archived Orders", False, "No admin token")
+            return False
+        return self.run_test("Get Archived Orders", "GET", "admin/orders/archive?limit=10", 200)[0]
+
+    def test_get_sales_report(self):
+        """Test the sales report endpoint (admin only)"""
+        if not self.token:
+            self.log_test("Get Sales Report", False, "No admin token")
+            return False
+        return self.run_test("Get Sales Report", "GET", "admin/reports?granularity=day", 200)[0]
+
+    def test_profiled_request(self):
+        """Test capturing and listing a request profile (admin only)"""
+        if not self.token:
+            self.log_test("Profiled Request", False, "No admin token")
+            return False
+        success, _ = self.run_test("Profiled Request", "GET", "products", 200, headers={"X-Profile": "1"})
+        if not success:
+            return False
+        return self.run_test("List Profiles", "GET", "admin/profiles", 200)[0]
+
+    def test_get_order_events(self):
+        """Test reading the order and stock event log (admin only)"""
+        if not self.token or not self.order_id:
+            self.log_test("Get Order Events", False, "Missing token or order ID")
+            return False
+        success, response = self.run_test("Get Order Events", "GET", f"admin/events?order_id={self.order_id}", 200)
+        if success:
+            print(f"   Events: {[event.get('type') for event in response]}")
+        return success
+
     def test_create_contact_message(self):
         """Test creating a contact message"""
         message_data = {
@@ -217,6 +271,7 @@ class MookiStoreAPITester:
         # Basic API tests
         self.test_root_endpoint()
         self.test_get_product()
+        self.test_get_product_cards()
         
         # Authentication tests
         self.test_invalid_login()
@@ -224,16 +279,23 @@ class MookiStoreAPITester:
         self.test_admin_verify()
         
         # Order tests
+        self.test_cart_quote()
         self.test_create_order()
         self.test_get_single_order()
         self.test_get_orders()
         self.test_update_order_status()
+        self.test_get_archived_orders()
+        self.test_get_sales_report()
+        self.test_get_order_events()
         
         # Contact tests
         self.test_create_contact_message()
         self.test_get_contact_messages()
         self.test_mark_message_read()
         
+        # Diagnostics tests
+        self.test_profiled_request()
+        
         # Product management tests
         self.test_update_product()
         
@@ -47,6 +47,7 @@ function AppContent() {
   const [cart, setCart] = useState([]);
   const [token, setToken] = useState(localStorage.getItem("admin_token") || null);
   const [product, setProduct] = useState(null);
+  const [quote, setQuote] = useState(null);
   const location = useLocation();
 
   // Initialize cart from localStorage
@@ -65,6 +66,33 @@ function AppContent() {
     fetchProduct();
   }, []);
 
+  // Server-side prices, totals and stock for the cart (debounced while quantities change)
+  useEffect(() => {
+    if (cart.length === 0) {
+      setQuote(null);
+      return;
+    }
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const response = await axios.post(`${API}/cart/quote`, {
+          items: cart.map((item) => ({ product_id: item.product_id, quantity: item.quantity })),
+        });
+        if (!cancelled) setQuote(response.data);
+      } catch (error) {
+        console.error("Failed to quote cart:", error);
+        if (!cancelled) setQuote(null);
+      }
+    }, 300);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [cart]);
+
+  const getQuoteLine = (productId) =>
+    quote?.items.find((line) => line.product_id === productId) || null;
+
   const fetchProduct = async () => {
     try {
       const response = await axios.get(`${API}/product`);
@@ -122,7 +150,10 @@ function AppContent() {
     localStorage.removeItem("cart");
   };
 
-  const cartTotal = cart.reduce((sum, item) => sum + item.price * item.quantity, 0);
+  // The quoted total is what the order will be charged; cached prices are only a fallback
+  const cartTotal = quote
+    ? quote.total
+    : cart.reduce((sum, item) => sum + item.price * item.quantity, 0);
   const cartCount = cart.reduce((sum, item) => sum + item.quantity, 0);
 
   const login = (newToken) => {
@@ -148,6 +179,8 @@ function AppContent() {
           clearCart,
           cartTotal,
           cartCount,
+          quote,
+          getQuoteLine,
           product,
           fetchProduct,
         }}
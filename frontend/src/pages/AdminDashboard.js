@@ -103,7 +103,7 @@ const AdminDashboard = () => {
 
   const fetchOrders = async () => {
     try {
-      const response = await axios.get(`${API}/orders`, {
+      const response = await axios.get(`${API}/orders?fields=row`, {
         headers: { Authorization: `Bearer ${token}` },
       });
       setOrders(response.data);
@@ -117,6 +117,17 @@ const AdminDashboard = () => {
     }
   };
 
+  const viewOrder = async (orderId) => {
+    // The list only holds summary rows; load the full order for the details panel
+    try {
+      const response = await axios.get(`${API}/orders/${orderId}`);
+      setSelectedOrder(response.data);
+    } catch (error) {
+      console.error("Failed to fetch order:", error);
+      toast.error("Failed to load order details");
+    }
+  };
+
   const fetchMessages = async () => {
     try {
       const response = await axios.get(`${API}/contact`, {
@@ -617,7 +628,7 @@ const AdminDashboard = () => {
                             <Button
                               variant="ghost"
                               size="sm"
-                              onClick={() => setSelectedOrder(order)}
+                              onClick={() => viewOrder(order.id)}
                               data-testid={`view-order-${order.id}`}
                             >
                               <Eye className="w-4 h-4" />
@@ -5,7 +5,8 @@ import { useCart } from "@/App";
 import { Button } from "@/components/ui/button";
 
 const Cart = () => {
-  const { cart, updateCartQuantity, removeFromCart, cartTotal, product } = useCart();
+  const { cart, updateCartQuantity, removeFromCart, cartTotal, quote, getQuoteLine, product } = useCart();
+  const hasStockProblems = quote && !quote.valid;
   const navigate = useNavigate();
 
   if (cart.length === 0) {
@@ -45,7 +46,10 @@ const Cart = () => {
           <div className="grid lg:grid-cols-3 gap-8">
             {/* Cart Items */}
             <div className="lg:col-span-2 space-y-4">
-              {cart.map((item, index) => (
+              {cart.map((item, index) => {
+                const line = getQuoteLine(item.product_id);
+                const price = line ? line.price : item.price;
+                return (
                 <motion.div
                   key={item.product_id}
                   initial={{ opacity: 0, x: -20 }}
@@ -69,8 +73,18 @@ const Cart = () => {
                       {item.product_name}
                     </h3>
                     <p className="text-[#FF4500] font-bold text-xl" data-testid="cart-item-price">
-                      ${item.price.toFixed(2)}
+                      ${price.toFixed(2)}
                     </p>
+                    {line && !line.available && (
+                      <p className="text-sm text-[#EF4444]" data-testid="cart-item-unavailable">
+                        No longer available
+                      </p>
+                    )}
+                    {line && line.available && line.shortfall > 0 && (
+                      <p className="text-sm text-[#EF4444]" data-testid="cart-item-shortfall">
+                        Only {line.stock} left in stock
+                      </p>
+                    )}
                   </div>
 
                   {/* Quantity Controls */}
@@ -88,7 +102,7 @@ const Cart = () => {
                       </span>
                       <button
                         onClick={() => {
-                          const maxStock = product?.stock || 999;
+                          const maxStock = line ? line.stock : product?.stock || 999;
                           if (item.quantity < maxStock) {
                             updateCartQuantity(item.product_id, item.quantity + 1);
                           }
@@ -113,11 +127,12 @@ const Cart = () => {
                   <div className="text-center sm:text-right min-w-[100px]">
                     <p className="text-xs text-[#A1A1AA] mb-1">Subtotal</p>
                     <p className="text-xl font-bold" data-testid="cart-item-subtotal">
-                      ${(item.price * item.quantity).toFixed(2)}
+                      ${(line ? line.line_total : price * item.quantity).toFixed(2)}
                     </p>
                   </div>
                 </motion.div>
-              ))}
+                );
+              })}
             </div>
 
             {/* Order Summary */}
@@ -147,8 +162,15 @@ const Cart = () => {
                   </div>
                 </div>
 
+                {hasStockProblems && (
+                  <p className="text-sm text-[#EF4444] mb-4" data-testid="cart-stock-warning">
+                    Some items are unavailable or exceed our stock. Please update your cart.
+                  </p>
+                )}
+
                 <Button
                   onClick={() => navigate("/checkout")}
+                  disabled={hasStockProblems}
                   className="w-full btn-primary py-4 rounded-full font-semibold flex items-center justify-center gap-2"
                   data-testid="checkout-btn"
                 >
@@ -12,7 +12,8 @@ import { Textarea } from "@/components/ui/textarea";
 import { RadioGroup, RadioGroupItem } from "@/components/ui/radio-group";
 
 const Checkout = () => {
-  const { cart, cartTotal, clearCart } = useCart();
+  const { cart, cartTotal, quote, getQuoteLine, clearCart } = useCart();
+  const hasStockProblems = quote && !quote.valid;
   const navigate = useNavigate();
   const [isLoading, setIsLoading] = useState(false);
   const [formData, setFormData] = useState({
@@ -41,6 +42,11 @@ const Checkout = () => {
       return;
     }
 
+    if (hasStockProblems) {
+      toast.error("Some items are unavailable or exceed our stock. Please update your cart.");
+      return;
+    }
+
     setIsLoading(true);
 
     try {
@@ -50,13 +56,11 @@ const Checkout = () => {
         email: formData.email || null,
         address: formData.address,
         payment_method: formData.payment_method,
+        // Prices and the total are set by the server from the catalog
         items: cart.map((item) => ({
           product_id: item.product_id,
-          product_name: item.product_name,
           quantity: item.quantity,
-          price: item.price,
         })),
-        total: cartTotal,
       };
 
       const response = await axios.post(`${API}/orders`, orderData);
@@ -240,7 +244,7 @@ const Checkout = () => {
                 <div className="lg:hidden">
                   <Button
                     type="submit"
-                    disabled={isLoading}
+                    disabled={isLoading || hasStockProblems}
                     className="w-full btn-primary py-4 rounded-full font-semibold"
                     data-testid="place-order-btn-mobile"
                   >
@@ -272,7 +276,9 @@ const Checkout = () => {
 
                 {/* Cart Items */}
                 <div className="space-y-4 mb-6">
-                  {cart.map((item) => (
+                  {cart.map((item) => {
+                    const line = getQuoteLine(item.product_id);
+                    return (
                     <div
                       key={item.product_id}
                       className="flex gap-4"
@@ -286,12 +292,18 @@ const Checkout = () => {
                       <div className="flex-grow">
                         <h3 className="font-semibold text-sm">{item.product_name}</h3>
                         <p className="text-[#A1A1AA] text-sm">Qty: {item.quantity}</p>
+                        {line && (!line.available || line.shortfall > 0) && (
+                          <p className="text-[#EF4444] text-sm" data-testid="checkout-item-stock-warning">
+                            {line.available ? `Only ${line.stock} left in stock` : "No longer available"}
+                          </p>
+                        )}
                       </div>
                       <p className="font-semibold">
-                        ${(item.price * item.quantity).toFixed(2)}
+                        ${(line ? line.line_total : item.price * item.quantity).toFixed(2)}
                       </p>
                     </div>
-                  ))}
+                    );
+                  })}
                 </div>
 
                 <div className="border-t border-[#262626] pt-4 space-y-3">
@@ -315,7 +327,7 @@ const Checkout = () => {
                 <Button
                   type="submit"
                   form="checkout-form"
-                  disabled={isLoading}
+                  disabled={isLoading || hasStockProblems}
                   onClick={handleSubmit}
                   className="hidden lg:flex w-full btn-primary py-4 rounded-full font-semibold mt-6 items-center justify-center gap-2"
                   data-testid="place-order-btn"
@@ -22,7 +22,7 @@ const Home = () => {
 
   const fetchProducts = async () => {
     try {
-      const response = await axios.get(`${API}/products`);
+      const response = await axios.get(`${API}/products?fields=card`);
       const availableProducts = response.data.filter(p => p.is_available);
       setProducts(availableProducts);
       if (availableProducts.length > 0) {